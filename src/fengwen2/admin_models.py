@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Annotated
 
-from pydantic import BaseModel, EmailStr
+from pydantic import AfterValidator, BaseModel, ConfigDict, StringConstraints
 from sqlalchemy import Column, Integer, String, Text, DateTime, Index
 
 from src.fengwen2.database import Base
@@ -35,46 +35,56 @@ class TranslationPair(Base):
 
 
 # Pydantic models (API request/response models)
+# 使用正则约束代替 EmailStr，校验在 pydantic-core 中完成，与 email_service.validate_email_format 规则一致
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+
+
+def _lowercase_email_domain(email: str) -> str:
+    """与 EmailStr 一致：域名转小写，本地部分保持原样（Redis key 和按邮箱查记录都依赖统一的大小写）"""
+    local, _, domain = email.rpartition('@')
+    return f"{local}@{domain.lower()}"
+
+
+EmailField = Annotated[
+    str, StringConstraints(pattern=EMAIL_PATTERN, max_length=254), AfterValidator(_lowercase_email_domain)
+]
+BirthDateField = Annotated[str, StringConstraints(pattern=r'^\d{4}-\d{1,2}-\d{1,2}$')]  # YYYY-MM-DD format
+BirthTimeField = Annotated[str, StringConstraints(pattern=r'^\d{1,2}:\d{2}$')]  # HH:MM format
+
+
 class UserInfoRequest(BaseModel):
     name: str
-    email: EmailStr
-    birth_date: str  # YYYY-MM-DD format
-    birth_time: str  # HH:MM format
+    email: EmailField
+    birth_date: BirthDateField
+    birth_time: BirthTimeField
     gender: str  # "Male" or "Female"
 
-    class Config:
-        # Pydantic v2 配置
-        str_strip_whitespace = True  # 自动去除字符串两端空白
-        str_min_length = 1  # 确保字符串不为空
+    # 请求模型只读（frozen），自动去除字符串两端空白并确保字符串不为空
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, str_min_length=1)
 
 
 class UserInfoWithVerificationRequest(BaseModel):
     name: str
-    email: EmailStr
-    birth_date: str  # YYYY-MM-DD format
-    birth_time: str  # HH:MM format
+    email: EmailField
+    birth_date: BirthDateField
+    birth_time: BirthTimeField
     gender: str  # "Male" or "Female"
     verification_code: str
 
-    class Config:
-        str_strip_whitespace = True
-        str_min_length = 1
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, str_min_length=1)
 
 
 class EmailRequest(BaseModel):
-    email: EmailStr
+    email: EmailField
 
-    class Config:
-        str_strip_whitespace = True
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True)
 
 
 class VerificationRequest(BaseModel):
-    email: EmailStr
+    email: EmailField
     code: str
 
-    class Config:
-        str_strip_whitespace = True
-        str_min_length = 1
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, str_min_length=1)
 
 
 class ProductUpdate(BaseModel):
@@ -82,31 +92,28 @@ class ProductUpdate(BaseModel):
     image_url: Optional[str] = None
     redirect_url: Optional[str] = None
 
-    class Config:
-        str_strip_whitespace = True
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True)
 
 
 class TranslationPairRequest(BaseModel):
     chinese_text: str
     english_text: str
 
-    class Config:
-        str_strip_whitespace = True
-        str_min_length = 1
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, str_min_length=1)
 
 
 class TranslationPairUpdate(BaseModel):
     chinese_text: str
     english_text: str
 
-    class Config:
-        str_strip_whitespace = True
-        str_min_length = 1
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True, str_min_length=1)
 
 
 class CreatePaymentLinkRequest(BaseModel):
     record_id: int
 
+    model_config = ConfigDict(frozen=True)
+
 
 class PaymentLinkResponse(BaseModel):
     shopify_url: str
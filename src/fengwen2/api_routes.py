@@ -26,7 +26,10 @@ from src.fengwen2.email_service import (
     EmailFormatError, EmailNotExistError, EmailBlacklistedError, EmailRateLimitError,
     EmailProviderError, EmailSendFailedError, validate_email_format
 )
-from src.fengwen2.service_manager import get_service_manager
+from src.fengwen2.order_service import send_purchase_report_email
+from src.fengwen2.service_manager import (
+    get_service_manager, get_email_service, get_shopify_service, get_astrology_service, get_verification_service, get_mjml_service
+)
 from src.fengwen2.verification_service import (
     VerificationCodeExpiredError, VerificationCodeInvalidError
 )
@@ -74,27 +77,6 @@ def clean_text(text: str) -> str:
     return html.escape(text.strip()[:200])
 
 
-# use dependency injection
-def get_email_service():
-    return get_service_manager().get_email_service()
-
-
-def get_shopify_service():
-    return get_service_manager().get_shopify_service()
-
-
-def get_astrology_service():
-    return get_service_manager().get_astrology_service()
-
-
-def get_verification_service():
-    return get_service_manager().get_verification_service()
-
-
-def get_mjml_service():
-    return get_service_manager().get_mjml_service()
-
-
 @router.post("/submit-info")
 async def submit_user_info(
         user_info: UserInfoRequest,
@@ -127,7 +109,10 @@ async def shopify_webhook(
         email_service=Depends(get_email_service),
         mjml_service=Depends(get_mjml_service)
 ):
-    """Handle Shopify payment webhooks with better error handling"""
+    """
+    Handle Shopify payment webhooks. The purchase is committed before Shopify gets its 200,
+    only the report email is handed to the background workers.
+    """
     try:
         body = await request.body()
         signature = request.headers.get("X-Shopify-Hmac-Sha256", "")
@@ -166,74 +151,43 @@ async def shopify_webhook(
                     record_id = record.id
                     logger.info(f"[WEBHOOK] Found record by email: {record_id}")
 
-        if record_id:
-            record = db.query(AstrologyRecord).filter(AstrologyRecord.id == record_id).first()
-
-            if record:
-                new_order_id = str(webhook_data.get("id"))
-
-                # 防止重复发送邮件
-                if record.shopify_order_id == new_order_id:
-                    logger.info(f"[WEBHOOK] Order {new_order_id} has already been processed for record {record_id}")
-                    return {"status": "already_processed_duplicate_webhook"}
-
-                record.is_purchased = True
-                record.shopify_order_id = new_order_id  # update the order_id
-
-                try:
-                    db.commit()
-                    logger.info(f"[WEBHOOK] Updated purchase status for record {record_id}")
-                except Exception as e:
-                    db.rollback()
-                    logger.error(f"[WEBHOOK] Database error: {e}")
-                    raise HTTPException(status_code=500, detail="Database error")
-
-                # send the full result to user's email
-                try:
-                    full_result_en = json.loads(str(record.full_result_en))
-                    astrology_result = AstrologyResultsView.model_validate(full_result_en)
-
-                    # pick the email template
-                    advantage_element = astrology_result.bazi.data.xiyongshen.rizhu_tiangan
-                    if advantage_element == '水' or advantage_element.lower() == 'water':
-                        email_template = 'astrology_report_water.mjml.j2'
-                    elif advantage_element == '火' or advantage_element.lower() == 'fire':
-                        email_template = 'astrology_report_fire.mjml.j2'
-                    elif advantage_element == '金' or advantage_element.lower() == 'metal':
-                        email_template = 'astrology_report_metal.mjml.j2'
-                    elif advantage_element == '木' or advantage_element.lower() == 'wood':
-                        email_template = 'astrology_report_wood.mjml.j2'
-                    else:
-                        email_template = 'astrology_report_earth.mjml.j2'
-
-                    # render the result
-                    email_content = mjml_service.render_astrology_result_email(
-                        template_name=email_template,
-                        astrology_results=astrology_result
-                    )
-
-                    email_sent = await email_service.send_astrology_result_email(
-                        email=record.email,
-                        astrology_result=email_content,
-                        subject='Your Astrology Report',
-                        content_type='html'
-                    )
-
-                    if email_sent:
-                        logger.info(f"[WEBHOOK] Result email sent to {record.email}")
-                    else:
-                        logger.error(f"[WEBHOOK] Failed to send email to {record.email}")
-
-                except Exception as e:
-                    logger.error(f"[WEBHOOK] Email service error: {e}")
-
-            else:
-                logger.error(f"[WEBHOOK] Record {record_id} not found in database")
-        else:
+        if not record_id:
             logger.error(f"[WEBHOOK] Could not identify record for order {webhook_data.get('id')}")
+            return {"status": "success"}
+
+        record = db.query(AstrologyRecord).filter(AstrologyRecord.id == record_id).first()
+        if not record:
+            logger.error(f"[WEBHOOK] Record {record_id} not found in database")
+            return {"status": "success"}
+
+        new_order_id = str(webhook_data.get("id"))
+
+        # 防止重复发送邮件
+        if record.shopify_order_id == new_order_id:
+            logger.info(f"[WEBHOOK] Order {new_order_id} has already been processed for record {record_id}")
+            return {"status": "already_processed_duplicate_webhook"}
+
+        record.is_purchased = True
+        record.shopify_order_id = new_order_id  # update the order_id
+
+        # 提交失败返回500，Shopify 会重新投递
+        try:
+            db.commit()
+            logger.info(f"[WEBHOOK] Updated purchase status for record {record_id}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"[WEBHOOK] Database error: {e}")
+            raise HTTPException(status_code=500, detail="Database error")
+
+        # 购买状态已落库，报告邮件交给后台 worker；队列已满时在请求内直接发送
+        if not get_service_manager().enqueue_report_email(record_id):
+            logger.warning(f"[WEBHOOK] Email queue full, sending result email for record {record_id} inline")
+            await send_purchase_report_email(record_id, email_service, mjml_service)
 
         return {"status": "success"}
 
+    except HTTPException:
+        raise
     except json.JSONDecodeError as e:
         logger.error(f"[WEBHOOK] Invalid JSON: {e}")
         raise HTTPException(status_code=400, detail="Invalid JSON")
@@ -799,7 +753,7 @@ async def test_send_email(
             logger.info(f"[TEST EMAIL] Using template: {email_template}")
 
             # 渲染邮件内容
-            email_content = mjml_service.render_astrology_result_email(
+            email_content = await mjml_service.render_astrology_result_email_async(
                 template_name=email_template,
                 astrology_results=astrology_result
             )
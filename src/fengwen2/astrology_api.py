@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import re
@@ -13,6 +14,11 @@ load_dotenv()
 
 ASTROLOGY_API_KEY = os.getenv("ASTROLOGY_API_KEY", "")
 
+# Image field name patterns to filter out, combined into one compiled regex
+_IMAGE_FIELD_RE = re.compile(r'img|image|pic|photo|avatar|thumb|icon|logo', re.IGNORECASE)
+_BASE64_RE = re.compile(r'^[A-Za-z0-9+/]*={0,2}$')
+_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg')
+
 
 class AstrologyAPIClient:
     """Client for calling astrology APIs"""
@@ -22,11 +28,23 @@ class AstrologyAPIClient:
         self.headers = {"Content-Type": "application/x-www-form-urlencoded"}
         self.base_url = "https://api.yuanfenju.com/index.php/v1"
 
-        # Image field patterns to filter out
-        self.image_field_patterns = [
-            r'.*img.*', r'.*image.*', r'.*pic.*', r'.*photo.*',
-            r'.*avatar.*', r'.*thumb.*', r'.*icon.*', r'.*logo.*'
-        ]
+        # Shared HTTP client, created on first call and kept warm across requests
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+            )
+        return self._client
+
+    async def aclose(self):
+        """Close the shared HTTP client, call once at application shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     def _filter_image_fields(self, data: Any) -> Any:
         """Recursively filter out image-related fields from API response"""
@@ -34,11 +52,7 @@ class AstrologyAPIClient:
             filtered_dict = {}
             for key, value in data.items():
                 # Check if field name matches image patterns
-                key_lower = key.lower()
-                is_image_field = any(re.match(pattern, key_lower, re.IGNORECASE)
-                                     for pattern in self.image_field_patterns)
-
-                if is_image_field:
+                if _IMAGE_FIELD_RE.search(key):
                     continue  # Skip image fields by name
 
                 # Check if value looks like image data
@@ -66,19 +80,18 @@ class AstrologyAPIClient:
             return True
 
         # Check for base64 image data (long strings that look like base64)
-        if len(value) > 1000 and re.match(r'^[A-Za-z0-9+/]*={0,2}$', value):
+        if len(value) > 1000 and _BASE64_RE.match(value):
             return True
 
         # Check for image URLs
         if (value_lower.startswith(('http://', 'https://')) and
-                any(ext in value_lower for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'])):
+                any(ext in value_lower for ext in _IMAGE_EXTENSIONS)):
             return True
 
         return False
 
     async def _call_api(self, endpoint: str, name: str, gender: str, birth_date: datetime, birth_time: str) -> Dict:
         """Generic API caller for all astrology endpoints"""
-        url = f"{self.base_url}/{endpoint}"
         hour, minute = birth_time.split(":")
 
         data = {
@@ -93,11 +106,10 @@ class AstrologyAPIClient:
             "minute": minute
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, data=data, headers=self.headers)
-            raw_data = response.json()
-            # Filter out image fields before returning
-            return self._filter_image_fields(raw_data)
+        response = await self._get_client().post(f"/{endpoint}", data=data)
+        raw_data = response.json()
+        # Filter out image fields before returning
+        return self._filter_image_fields(raw_data)
 
     async def call_bazi_api(self, name: str, gender: str, birth_date: datetime, birth_time: str) -> Dict:
         """Call Bazi calculation API"""
@@ -128,12 +140,18 @@ class AstrologyAPIClient:
             "liudao": self.call_liudao_api
         }
 
+        # 三个接口互不依赖，并发调用
+        responses = await asyncio.gather(
+            *(api_func(name, gender, birth_date, birth_time) for api_func in api_calls.values()),
+            return_exceptions=True
+        )
+
         results = {}
-        for api_name, api_func in api_calls.items():
-            try:
-                results[api_name] = await api_func(name, gender, birth_date, birth_time)
-            except Exception as e:
-                logger.error(f"Error calling {api_name} API for name={name}: {e}")
-                results[api_name] = {"error": str(e)}
+        for api_name, response in zip(api_calls, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Error calling {api_name} API for name={name}: {response}")
+                results[api_name] = {"error": str(response)}
+            else:
+                results[api_name] = response
 
         return results
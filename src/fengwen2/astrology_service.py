@@ -12,7 +12,6 @@ from src.fengwen2.astrology_types import *
 from src.fengwen2.astrology_views import *
 from src.fengwen2.calendar_converter import gregorian_to_lunar
 from src.fengwen2.database import AstrologyRecord
-from src.fengwen2.shopify_service import ShopifyPaymentService
 from src.fengwen2.translation import EnhancedTranslationService
 
 logger = logging.getLogger(__name__)
@@ -24,7 +23,10 @@ class AstrologyService:
     def __init__(self):
         self.astrology_client = AstrologyAPIClient()
         self.translation_service = EnhancedTranslationService()
-        self.shopify_service = ShopifyPaymentService()
+
+    async def aclose(self):
+        await self.astrology_client.aclose()
+        await self.translation_service.aclose()
 
     @staticmethod
     def create_record(email: str, name: str, birth_date: str, birth_time: str, gender: str,
@@ -74,7 +76,7 @@ class AstrologyService:
                 db.commit()
                 logger.info(f"[SERVICE] Full results saved: {list(valid_results.keys())}")
         except ValidationError as e:
-            error_summary = "; ".join([f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+            error_summary = "; ".join([f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors(include_url=False, include_input=False)])
             logger.error(f"[VALIDATION ERROR] Summary: {error_summary}", exc_info=True)
         except Exception as e:
             logger.error(f"[SERVICE] Error generating full results: {e}", exc_info=True)
@@ -21,10 +21,9 @@ async def init_cache():
 
 def generate_cache_key(prefix: str, **kwargs) -> str:
     """Generate a consistent cache key from request parameters"""
-    # Sort kwargs to ensure consistent key generation
-    sorted_params = sorted(kwargs.items())
-    key_data = json.dumps(sorted_params, sort_keys=True, default=str)
-    hash_digest = hashlib.md5(key_data.encode()).hexdigest()
+    # Sort kwargs to ensure consistent key generation (a list, so json sort_keys would be a no-op)
+    key_data = json.dumps(sorted(kwargs.items()), default=str)
+    hash_digest = hashlib.md5(key_data.encode(), usedforsecurity=False).hexdigest()
     return f"{prefix}:{hash_digest}"
 
 
@@ -6,7 +6,7 @@ from datetime import timedelta, datetime
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from src.fengwen2.admin_auth import get_current_admin_user, create_access_token, verify_password, ADMIN_USERNAME, \
@@ -127,6 +127,23 @@ async def health():
     return health_status
 
 
+# 后台页面是纯静态 HTML，首次访问后缓存文件内容，避免每次请求重复 stat/open
+_admin_pages: dict[str, bytes] = {}
+
+
+def _get_admin_page(filename: str) -> bytes | None:
+    """读取 static 目录下的后台页面，文件不存在时返回 None"""
+    page = _admin_pages.get(filename)
+    if page is None:
+        page_path = os.path.join("static", filename)
+        if not os.path.exists(page_path):
+            return None
+        with open(page_path, "rb") as f:
+            page = f.read()
+        _admin_pages[filename] = page
+    return page
+
+
 # Admin routes
 @app.get("/admin/login", response_class=HTMLResponse)
 async def admin_login_page(request: Request):
@@ -137,11 +154,11 @@ async def admin_login_page(request: Request):
     if current_user:
         return RedirectResponse(url="/admin", status_code=302)
 
-    login_html_path = os.path.join("static", "login.html")
-    if not os.path.exists(login_html_path):
+    login_page = _get_admin_page("login.html")
+    if login_page is None:
         raise HTTPException(status_code=404, detail="登录页面文件未找到")
 
-    return FileResponse(login_html_path)
+    return HTMLResponse(content=login_page)
 
 
 @app.post("/admin/login")
@@ -198,11 +215,11 @@ async def admin_dashboard(request: Request):
     if not current_user:
         return RedirectResponse(url="/admin/login", status_code=302)
 
-    admin_html_path = os.path.join("static", "admin.html")
-    if not os.path.exists(admin_html_path):
+    admin_page = _get_admin_page("admin.html")
+    if admin_page is None:
         raise HTTPException(status_code=404, detail="管理界面文件未找到")
 
-    return FileResponse(admin_html_path)
+    return HTMLResponse(content=admin_page)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,11 @@
+import asyncio
 import logging
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any
 
@@ -16,8 +18,13 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# 同时运行的 mjml 子进程上限，防止 webhook 突发时拉起过多 node 进程
+MJML_RENDER_CONCURRENCY = int(os.getenv("MJML_RENDER_CONCURRENCY", 3))
 
+
+@lru_cache(maxsize=1)
 def get_mjml_executable_path() -> str | None:
+    """查找 mjml 可执行文件路径，结果在进程内缓存（路径运行期间不会变化）"""
     home = Path.home()
     if os.getenv("MJML_EXECUTABLE_PATH", None) is not None:  # 优先使用环境变量
         path = Path(os.getenv("MJML_EXECUTABLE_PATH"))
@@ -62,6 +69,19 @@ def get_mjml_executable_path() -> str | None:
         return None
 
 
+@lru_cache(maxsize=None)
+def _mjml_version(mjml_command: str) -> str:
+    """运行 `mjml --version` 并缓存结果，每个可执行文件只检查一次"""
+    result = subprocess.run(
+        [mjml_command, "--version"],
+        capture_output=True,
+        text=True,
+        check=True,
+        encoding="utf-8"
+    )
+    return result.stdout.strip()
+
+
 class MJMLEmailService:
     """
     MJML邮件服务类，处理从mjml.j2模板到HTML邮件的转换
@@ -92,19 +112,18 @@ class MJMLEmailService:
             trim_blocks=True,
             lstrip_blocks=True
         )
-        self._verify_mjml_installation()
+        self._render_semaphore = asyncio.Semaphore(MJML_RENDER_CONCURRENCY)
+
+    def verify_mjml_installation(self):
+        """
+        检查mjml命令是否可用，应在应用启动时调用一次
 
-    def _verify_mjml_installation(self):
+        Raises:
+            RuntimeError: mjml命令不存在或无法运行
+        """
         try:
-            result = subprocess.run(
-                [self.mjml_command, "--version"],
-                capture_output=True,
-                text=True,
-                check=True,
-                encoding="utf-8"
-            )
-            logger.info(f"MJML version: {result.stdout.strip()}")
-        except (subprocess.CalledProcessError, FileNotFoundError):
+            logger.info(f"MJML version: {_mjml_version(self.mjml_command)}")
+        except (subprocess.CalledProcessError, FileNotFoundError, TypeError):
             raise RuntimeError(
                 f"MJML command '{self.mjml_command}' not found. "
                 "Please install it using: npm install -g mjml"
@@ -227,6 +246,18 @@ class MJMLEmailService:
             context.update(additional_context)
         return self.render_email(template_name, context)
 
+    async def render_astrology_result_email_async(self,
+                                                  template_name: str,
+                                                  astrology_results: 'AstrologyResultsView',
+                                                  additional_context: Optional[Dict[str, Any]] = None) -> str:
+        """
+        render_astrology_result_email 的异步版本：在线程中运行，不阻塞事件循环，并发数受 MJML_RENDER_CONCURRENCY 限制
+        """
+        async with self._render_semaphore:
+            return await asyncio.to_thread(
+                self.render_astrology_result_email, template_name, astrology_results, additional_context
+            )
+
     def render_verification_code_email(self,
                                        code: str,
                                        additional_context: Optional[Dict[str, Any]] = None) -> str:
@@ -0,0 +1,65 @@
+import json
+import logging
+
+from src.fengwen2.astrology_views import AstrologyResultsView
+from src.fengwen2.database import AstrologyRecord, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def pick_report_template(advantage_element: str) -> str:
+    """根据喜用神日主天干选择报告邮件模板"""
+    if advantage_element == '水' or advantage_element.lower() == 'water':
+        return 'astrology_report_water.mjml.j2'
+    elif advantage_element == '火' or advantage_element.lower() == 'fire':
+        return 'astrology_report_fire.mjml.j2'
+    elif advantage_element == '金' or advantage_element.lower() == 'metal':
+        return 'astrology_report_metal.mjml.j2'
+    elif advantage_element == '木' or advantage_element.lower() == 'wood':
+        return 'astrology_report_wood.mjml.j2'
+    return 'astrology_report_earth.mjml.j2'
+
+
+async def send_purchase_report_email(record_id: int, email_service, mjml_service) -> bool:
+    """
+    渲染并发送已购买记录的完整结果邮件。
+    购买状态应在调用前已提交到数据库，这里只读取记录，使用独立的数据库会话。
+
+    Returns:
+        邮件是否发送成功
+    """
+    db = SessionLocal()
+    try:
+        record = db.query(AstrologyRecord).filter(AstrologyRecord.id == record_id).first()
+        if not record:
+            logger.error(f"[WEBHOOK] Record {record_id} not found when sending result email")
+            return False
+
+        full_result_en = json.loads(str(record.full_result_en))
+        astrology_result = AstrologyResultsView.model_validate(full_result_en)
+        email_template = pick_report_template(astrology_result.bazi.data.xiyongshen.rizhu_tiangan)
+
+        # render the result
+        email_content = await mjml_service.render_astrology_result_email_async(
+            template_name=email_template,
+            astrology_results=astrology_result
+        )
+
+        email_sent = await email_service.send_astrology_result_email(
+            email=record.email,
+            astrology_result=email_content,
+            subject='Your Astrology Report',
+            content_type='html'
+        )
+
+        if email_sent:
+            logger.info(f"[WEBHOOK] Result email sent to {record.email}")
+        else:
+            logger.error(f"[WEBHOOK] Failed to send email to {record.email}")
+        return email_sent
+
+    except Exception as e:
+        logger.error(f"[WEBHOOK] Email service error for record {record_id}: {e}", exc_info=True)
+        return False
+    finally:
+        db.close()
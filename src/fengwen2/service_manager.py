@@ -1,66 +1,161 @@
+import asyncio
 import logging
+import os
+import threading
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+WEBHOOK_DRAIN_TIMEOUT = 30  # seconds to finish queued report emails on shutdown
 
-class ServiceManager:
-    _instance = None
-    _initialized = False
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(ServiceManager, cls).__new__(cls)
-        return cls._instance
+class _locked_cached_property:
+    """
+    与 functools.cached_property 相同，但首次创建时加锁。
+    get_*_service 依赖是普通 def，由 FastAPI 在线程池中解析；Python 3.12 起 cached_property 不再加锁，
+    并发的首次请求可能各自创建一个实例，多出来的实例持有的客户端不会在 shutdown 时关闭。
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        # 创建后实例 __dict__ 中的值会直接遮蔽本描述符，之后的访问不再经过这里
+        with instance._services_lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.func(instance)
+            return instance.__dict__[self.name]
+
+
+class ServiceManager:
+    """Holds the shared service instances; the module-level instance below is the singleton"""
 
     def __init__(self):
-        if not self._initialized:
-            from src.fengwen2.email_service import EmailService
-            from src.fengwen2.shopify_service import ShopifyPaymentService
-            from src.fengwen2.astrology_service import AstrologyService
-            from src.fengwen2.mjml_render_service import MJMLEmailService
-            from src.fengwen2.verification_service import VerificationService
-
-            self.email_service = EmailService()
-            self.shopify_service = ShopifyPaymentService()
-            self.astrology_service = AstrologyService()
-            self.verification_service = VerificationService()
-            self.mjml_render_service = MJMLEmailService(
-                template_dir="templates",  # 模板目录
-                mjml_options={
-                    "minify": True,  # 压缩HTML
-                    "beautify": False,  # 美化输出
-                    "validation_level": "soft"  # 验证级别：strict, soft, skip
-                }
-            )
-
-            ServiceManager._initialized = True
-            logger.info("ServiceManager initialized successfully")
+        # RLock: a service factory may touch another lazily created service
+        self._services_lock = threading.RLock()
+        # report emails for paid orders, created in startup() on the running event loop
+        self._webhook_queue: Optional[asyncio.Queue] = None
+        self._webhook_workers: List[asyncio.Task] = []
+
+        logger.info("ServiceManager initialized successfully")
+
+    # 各服务在首次访问时才导入并实例化，只用到部分服务的进程不必承担全部启动开销
+    @_locked_cached_property
+    def email_service(self):
+        from src.fengwen2.email_service import EmailService
+        return EmailService()
+
+    @_locked_cached_property
+    def shopify_service(self):
+        from src.fengwen2.shopify_service import ShopifyPaymentService
+        return ShopifyPaymentService()
+
+    @_locked_cached_property
+    def astrology_service(self):
+        from src.fengwen2.astrology_service import AstrologyService
+        return AstrologyService()
+
+    @_locked_cached_property
+    def verification_service(self):
+        from src.fengwen2.verification_service import VerificationService
+        return VerificationService()
+
+    @_locked_cached_property
+    def mjml_render_service(self):
+        from src.fengwen2.mjml_render_service import MJMLEmailService
+        return MJMLEmailService(
+            template_dir="templates",  # 模板目录
+            mjml_options={
+                "minify": True,  # 压缩HTML
+                "beautify": False,  # 美化输出
+                "validation_level": "soft"  # 验证级别：strict, soft, skip
+            }
+        )
 
     async def startup(self):
         logger.info("Starting up services...")
+        self.mjml_render_service.verify_mjml_installation()
+        await self.shopify_service.async_init()
+
+        # one worker per allowed mjml render so the render semaphore is actually used
+        from src.fengwen2.mjml_render_service import MJML_RENDER_CONCURRENCY
+        self._webhook_queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self._webhook_workers = [
+            asyncio.create_task(self._drain_webhooks()) for _ in range(MJML_RENDER_CONCURRENCY)
+        ]
 
     async def shutdown(self):
         logger.info("Shutting down services...")
+        if self._webhook_workers:
+            # purchases are already committed, give queued report emails a chance to go out
+            try:
+                await asyncio.wait_for(self._webhook_queue.join(), timeout=WEBHOOK_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"{self._webhook_queue.qsize()} report emails still queued at shutdown")
+            for worker in self._webhook_workers:
+                worker.cancel()
+            await asyncio.gather(*self._webhook_workers, return_exceptions=True)
+            self._webhook_workers = []
+
+        await self.shopify_service.aclose()
+        if "astrology_service" in self.__dict__:  # only close what was actually created
+            await self.astrology_service.aclose()
+
+    def enqueue_report_email(self, record_id: int) -> bool:
+        """Queue the result email for a purchased record, returns False when the queue is full or not started"""
+        if self._webhook_queue is None:
+            logger.error("Report email queue is not started")
+            return False
+        try:
+            self._webhook_queue.put_nowait(record_id)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _drain_webhooks(self):
+        from src.fengwen2.order_service import send_purchase_report_email
+
+        while True:
+            record_id = await self._webhook_queue.get()
+            try:
+                await send_purchase_report_email(record_id, self.email_service, self.mjml_render_service)
+            except Exception as e:
+                logger.error(f"Error sending result email for record {record_id}: {e}", exc_info=True)
+            finally:
+                self._webhook_queue.task_done()
+
+
+# module import runs exactly once (guarded by the import lock), so this is the singleton
+service_manager = ServiceManager()
 
-    def get_email_service(self):
-        return self.email_service
 
-    def get_shopify_service(self):
-        return self.shopify_service
+def get_service_manager() -> ServiceManager:
+    return service_manager
 
-    def get_astrology_service(self):
-        return self.astrology_service
 
-    def get_verification_service(self):
-        return self.verification_service
+# FastAPI dependencies
+def get_email_service():
+    return service_manager.email_service
 
-    def get_mjml_service(self):
-        return self.mjml_render_service
 
+def get_shopify_service():
+    return service_manager.shopify_service
 
-# singleton pattern
-service_manager = ServiceManager()
 
+def get_astrology_service():
+    return service_manager.astrology_service
 
-def get_service_manager() -> ServiceManager:
-    return service_manager
+
+def get_verification_service():
+    return service_manager.verification_service
+
+
+def get_mjml_service():
+    return service_manager.mjml_render_service
@@ -1,11 +1,14 @@
+import asyncio
 import base64
-import hashlib
+import binascii
+import functools
 import hmac
 import json
 import logging
 import os
+import re
 from typing import Optional, Dict
-from urllib.parse import urlencode
+from urllib.parse import quote_plus
 
 import httpx
 from dotenv import load_dotenv
@@ -13,6 +16,131 @@ from dotenv import load_dotenv
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+# Shopify settings are read once at import
+_ACCESS_TOKEN = os.getenv("SHOPIFY_ACCESS_TOKEN", "")  # 需要从 Shopify Admin 获取
+_SHOP_DOMAIN = os.getenv("SHOPIFY_SHOP_DOMAIN", "fengculture.com")
+_API_VERSION = "2024-01"
+_ADMIN_API_URL = f"https://{_SHOP_DOMAIN}/admin/api/{_API_VERSION}"
+_PRODUCT_VARIANT_ID = os.getenv("SHOPIFY_PRODUCT_VARIANT_ID")  # 需要从 Shopify 获取
+# Headers for API requests, built once as httpx.Headers and shared by the client
+_HEADERS = httpx.Headers([
+    ("X-Shopify-Access-Token", _ACCESS_TOKEN),
+    ("Content-Type", "application/json")
+])
+
+_RECORD_ID_RE = re.compile(r'record_(\d+)')
+_TAG_RE = re.compile(r'(?:^|,)\s*record_(\d+)\s*(?:,|$)')  # a whole tag in the comma-separated list
+
+
+def _safe(default=None):
+    """Log and swallow any exception from an async Shopify call, returning ``default`` instead"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                logger.error("%s failed: %s", fn.__name__, e)
+                return default
+        return wrapper
+    return decorator
+
+
+def _name_value_map(attributes) -> Dict:
+    """Build a lowercase name -> value dict from a Shopify name/value attribute list, the first entry for a name wins"""
+    mapping = {}
+    for attr in attributes:
+        mapping.setdefault(attr.get("name", "").lower(), attr.get("value"))
+    return mapping
+
+
+# record_id extractors, see _EXTRACTORS below
+def _record_id_from_line_items(order_data: Dict) -> Optional[str]:
+    """1. Check line item properties"""
+    # first matching property across all line items wins, in order
+    record_id = next((
+        prop.get("value")
+        for item in order_data.get("line_items", ())
+        for prop in item.get("properties") or ()
+        if prop.get("name", "").lower() in ("record_id", "record id") and prop.get("value")
+    ), None)
+    if record_id:
+        logger.info(f"Found record_id in line item properties: {record_id}")
+    return record_id
+
+
+def _record_id_from_note_attributes(order_data: Dict) -> Optional[str]:
+    """2. Check note attributes"""
+    attrs = _name_value_map(order_data.get("note_attributes", ()))
+    if "record_id" not in attrs:
+        return None
+    record_id = attrs["record_id"]
+    logger.info(f"Found record_id in note attributes: {record_id}")
+    return record_id
+
+
+def _record_id_from_note(order_data: Dict) -> Optional[str]:
+    """3. Check order note"""
+    note = order_data.get("note", "")
+    if "Record ID:" not in note:
+        return None
+    record_id = note.split("Record ID:")[1].strip().split()[0]
+    logger.info(f"Found record_id in order note: {record_id}")
+    return record_id
+
+
+def _record_id_from_tags(order_data: Dict) -> Optional[str]:
+    """4. Check order tags"""
+    match = _TAG_RE.search(order_data.get("tags", ""))
+    if not match:
+        return None
+    record_id = match.group(1)
+    logger.info(f"Found record_id in tags: {record_id}")
+    return record_id
+
+
+def _record_id_from_cart_attributes(order_data: Dict) -> Optional[str]:
+    """5. Check cart attributes (from checkout)"""
+    record_id = order_data.get("cart_attributes", {}).get("record_id")
+    if record_id:
+        logger.info(f"Found record_id in cart attributes: {record_id}")
+    return record_id
+
+
+def _record_id_from_customer_note(order_data: Dict) -> Optional[str]:
+    """6. Check customer attributes (alternative checkout location)"""
+    customer = order_data.get("customer", {})
+    if not customer:
+        return None
+    match = _RECORD_ID_RE.search(customer.get("note", ""))
+    if not match:
+        return None
+    record_id = match.group(1)
+    logger.info(f"Found record_id in customer note: {record_id}")
+    return record_id
+
+
+def _record_id_from_order_attributes(order_data: Dict) -> Optional[str]:
+    """7. Check order attributes (another possible location)"""
+    attrs = _name_value_map(order_data.get("order_attributes", ()))
+    if "record_id" not in attrs:
+        return None
+    record_id = attrs["record_id"]
+    logger.info(f"Found record_id in order attributes: {record_id}")
+    return record_id
+
+
+# tried in order, first non-empty value wins
+_EXTRACTORS = (
+    _record_id_from_line_items,
+    _record_id_from_note_attributes,
+    _record_id_from_note,
+    _record_id_from_tags,
+    _record_id_from_cart_attributes,
+    _record_id_from_customer_note,
+    _record_id_from_order_attributes,
+)
+
 
 class ShopifyPaymentService:
     """
@@ -23,29 +151,49 @@ class ShopifyPaymentService:
     """
 
     def __init__(self, use_plus_features: bool = None):
-        # Admin API credentials
-        self.access_token = os.getenv("SHOPIFY_ACCESS_TOKEN")  # 需要从 Shopify Admin 获取
         self.webhook_secret = os.getenv("SHOPIFY_WEBHOOK_SECRET")
-        self.shop_domain = os.getenv("SHOPIFY_SHOP_DOMAIN", "fengculture.com")
-        self.api_version = "2024-01"
-        
+        self._webhook_secret_bytes = (self.webhook_secret or "").encode('utf-8')
+        self._webhook_verify_enabled = bool(self.webhook_secret)
+        if not self._webhook_verify_enabled:
+            logger.warning("Webhook secret not configured, webhook signatures will not be verified")
+
         # 确定是否使用Plus功能
         if use_plus_features is not None:
             self.use_plus_features = use_plus_features
         else:
             self.use_plus_features = os.getenv("SHOPIFY_USE_PLUS_FEATURES", "false").lower() in ("true", "1", "yes")
 
-        # Product variant ID - 需要从 Shopify 获取
-        self.product_variant_id = os.getenv("SHOPIFY_PRODUCT_VARIANT_ID")
-
-        # Base API URLs
-        self.admin_api_url = f"https://{self.shop_domain}/admin/api/{self.api_version}"
+        # Shared HTTP client, created in async_init() (or on first use) so connections are reused across calls
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+
+    async def async_init(self):
+        """Create the shared HTTP client, call once at application startup"""
+        await self._get_client()
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it if startup has not done so yet"""
+        if self._client is not None:
+            return self._client
+        async with self._client_lock:
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    base_url=_ADMIN_API_URL,
+                    headers=_HEADERS,
+                    timeout=10.0,
+                    # limits go on the transport, the client ignores them when a transport is given
+                    transport=httpx.AsyncHTTPTransport(
+                        retries=2,  # connection errors only, not HTTP status codes
+                        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60)
+                    )
+                )
+        return self._client
 
-        # Headers for API requests
-        self.headers = {
-            "X-Shopify-Access-Token": self.access_token,
-            "Content-Type": "application/json"
-        }
+    async def aclose(self):
+        """Close the shared HTTP client, call once at application shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def create_checkout_url(self, user_email: str, record_id: int) -> Optional[str]:
         """Create checkout URL - uses appropriate method based on account type"""
@@ -70,156 +218,127 @@ class ShopifyPaymentService:
             logger.error(f"Error creating checkout URL: {e}")
             return None
     
+    @_safe()
     async def create_draft_order_url(self, user_email: str, record_id: int) -> Optional[str]:
         """Create a draft order - fallback method without discount code support"""
-        try:
-            draft_order_url = await self._create_draft_order(user_email, record_id)
-            return draft_order_url
-        except Exception as e:
-            logger.error(f"Error creating draft order URL: {e}")
-            return None
+        return await self._create_draft_order(user_email, record_id)
 
     async def _create_cart_link(self, user_email: str, record_id: int) -> Optional[str]:
         """Create a cart link with metadata for standard Shopify accounts"""
         try:
-            if not self.product_variant_id:
+            if not _PRODUCT_VARIANT_ID:
                 logger.error("Product variant ID not configured")
                 return None
             
             # 基础购物车链接格式: https://shop.myshopify.com/cart/variant_id:quantity
-            base_cart_url = f"https://{self.shop_domain}/cart/{self.product_variant_id}:1"
-            
-            # 添加URL参数传递元数据
-            params = {
-                "record_id": str(record_id),
-                "service": "astrology_reading",
-                "customer_email": user_email,
-                "note": f"Astrology Reading - Record ID: {record_id}"
-            }
+            base_cart_url = f"https://{_SHOP_DOMAIN}/cart/{_PRODUCT_VARIANT_ID}:1"
             
+            # 添加URL参数传递元数据，参数固定，只有邮箱需要编码（record_id 为整数）
+            query = (
+                f"record_id={record_id}&service=astrology_reading"
+                f"&customer_email={quote_plus(user_email)}"
+                f"&note=Astrology+Reading+-+Record+ID%3A+{record_id}"
+            )
+
             # 构建完整的URL
-            cart_url = f"{base_cart_url}?{urlencode(params)}"
+            cart_url = f"{base_cart_url}?{query}"
             logger.info(f"Created cart link for record {record_id}: {cart_url}")
             return cart_url
             
         except Exception as e:
             logger.error(f"Error creating cart link: {e}")
-            return f"https://{self.shop_domain}/cart/{self.product_variant_id}:1"
-
+            return f"https://{_SHOP_DOMAIN}/cart/{_PRODUCT_VARIANT_ID}:1"
+
+    def _order_fields(self, record_id: str) -> Dict:
+        """Fields shared by the Plus checkout and draft order payloads"""
+        return {
+            "line_items": [
+                {
+                    "variant_id": _PRODUCT_VARIANT_ID,
+                    "quantity": 1,
+                    "properties": [
+                        {"name": "record_id", "value": record_id}
+                    ]
+                }
+            ],
+            "note": f"Astrology Reading - Record ID: {record_id}",
+            "tags": f"astrology,record_{record_id}",
+            "note_attributes": [
+                {"name": "record_id", "value": record_id},
+                {"name": "service", "value": "astrology_reading"}
+            ]
+        }
 
+    @_safe()
     async def _create_plus_checkout(self, user_email: str, record_id: int) -> Optional[str]:
         """Create a checkout session using Plus API (requires Shopify Plus)"""
-        try:
-            async with httpx.AsyncClient() as client:
-                checkout_data = {
-                    "checkout": {
-                        "line_items": [
-                            {
-                                "variant_id": self.product_variant_id,
-                                "quantity": 1,
-                                "properties": [
-                                    {"name": "record_id", "value": str(record_id)}
-                                ]
-                            }
-                        ],
-                        "email": user_email,
-                        "note": f"Astrology Reading - Record ID: {record_id}",
-                        "note_attributes": [
-                            {"name": "record_id", "value": str(record_id)},
-                            {"name": "service", "value": "astrology_reading"}
-                        ],
-                        "cart_attributes": {
-                            "record_id": str(record_id),
-                            "service": "astrology_reading"
-                        },
-                        "tags": f"astrology,record_{record_id}",
-                        "allow_discount_codes": True
-                    }
-                }
-
-                response = await client.post(
-                    f"{self.admin_api_url}/checkouts.json",
-                    headers=self.headers,
-                    json=checkout_data
-                )
+        record_id_str = str(record_id)
+        checkout_data = {
+            "checkout": {
+                **self._order_fields(record_id_str),
+                "email": user_email,
+                "cart_attributes": {
+                    "record_id": record_id_str,
+                    "service": "astrology_reading"
+                },
+                "allow_discount_codes": True
+            }
+        }
 
-                if response.status_code == 201:
-                    checkout = response.json()["checkout"]
-                    checkout_url = checkout.get("web_url")
-                    logger.info(f"Created Plus checkout for record {record_id}: {checkout_url}")
-                    return checkout_url
-                else:
-                    logger.error(f"Failed to create Plus checkout: {response.text}")
-                    return None
+        client = await self._get_client()
+        response = await client.post("/checkouts.json", json=checkout_data)
 
-        except Exception as e:
-            logger.error(f"Error creating Plus checkout: {e}")
+        if response.status_code == 201:
+            checkout = response.json()["checkout"]
+            checkout_url = checkout.get("web_url")
+            logger.info(f"Created Plus checkout for record {record_id}: {checkout_url}")
+            return checkout_url
+        else:
+            logger.error(f"Failed to create Plus checkout: {response.text}")
             return None
 
+    @_safe()
     async def _create_draft_order(self, user_email: str, record_id: int) -> Optional[str]:
         """Create a draft order with custom attributes"""
-        try:
-            async with httpx.AsyncClient() as client:
-                draft_order_data = {
-                    "draft_order": {
-                        "line_items": [
-                            {
-                                "variant_id": self.product_variant_id,
-                                "quantity": 1,
-                                "properties": [
-                                    {"name": "record_id", "value": str(record_id)}
-                                ]
-                            }
-                        ],
-                        "customer": {
-                            "email": user_email
-                        },
-                        "note": f"Astrology Reading - Record ID: {record_id}",
-                        "tags": f"astrology,record_{record_id}",
-                        "note_attributes": [
-                            {"name": "record_id", "value": str(record_id)},
-                            {"name": "service", "value": "astrology_reading"}
-                        ]
-                    }
+        draft_order_data = {
+            "draft_order": {
+                **self._order_fields(str(record_id)),
+                "customer": {
+                    "email": user_email
                 }
+            }
+        }
 
-                response = await client.post(
-                    f"{self.admin_api_url}/draft_orders.json",
-                    headers=self.headers,
-                    json=draft_order_data
-                )
-
-                if response.status_code == 201:
-                    draft_order = response.json()["draft_order"]
-                    invoice_url = draft_order.get("invoice_url")
-                    logger.info(f"Created draft order for record {record_id}: {invoice_url}")
-                    return invoice_url
-                else:
-                    logger.error(f"Failed to create draft order: {response.text}")
-                    return None
+        client = await self._get_client()
+        response = await client.post("/draft_orders.json", json=draft_order_data)
 
-        except Exception as e:
-            logger.error(f"Error creating draft order: {e}")
+        if response.status_code == 201:
+            draft_order = response.json()["draft_order"]
+            invoice_url = draft_order.get("invoice_url")
+            logger.info(f"Created draft order for record {record_id}: {invoice_url}")
+            return invoice_url
+        else:
+            logger.error(f"Failed to create draft order: {response.text}")
             return None
 
     def verify_webhook(self, data: bytes, signature: str) -> bool:
         """Verify Shopify webhook signature"""
+        if not self._webhook_verify_enabled:
+            return True
+
+        # decode the header once and compare raw 32-byte digests
+        try:
+            provided_hmac = base64.b64decode(signature, validate=True)
+        except (binascii.Error, ValueError):
+            logger.warning(f"Malformed webhook signature: {signature}")
+            return False
+
         try:
-            if not self.webhook_secret:
-                logger.warning("Webhook secret not configured")
-                return True
-
-            calculated_hmac = base64.b64encode(
-                hmac.new(
-                    self.webhook_secret.encode('utf-8'),
-                    data,
-                    hashlib.sha256
-                ).digest()
-            ).decode('utf-8')
-
-            is_valid = hmac.compare_digest(signature, calculated_hmac)
+            calculated_hmac = hmac.digest(self._webhook_secret_bytes, data, 'sha256')
+
+            is_valid = hmac.compare_digest(provided_hmac, calculated_hmac)
             if not is_valid:
-                logger.warning(f"Invalid webhook signature. Expected: {calculated_hmac}, Got: {signature}")
+                logger.warning(f"Invalid webhook signature. Expected: {base64.b64encode(calculated_hmac).decode()}, Got: {signature}")
             return is_valid
 
         except Exception as e:
@@ -230,100 +349,27 @@ class ShopifyPaymentService:
     def extract_record_id_from_order(order_data: Dict) -> Optional[int]:
         """Extract astrology record ID from multiple possible locations"""
         try:
-            record_id = None
-
-            # 1. Check line item properties
-            line_items = order_data.get("line_items", [])
-            for item in line_items:
-                properties = item.get("properties", [])
-                for prop in properties:
-                    if prop.get("name", "").lower() in ["record_id", "record id"]:
-                        record_id = prop.get("value")
-                        logger.info(f"Found record_id in line item properties: {record_id}")
-                        break
-                if record_id:
-                    break
-
-            # 2. Check note attributes
-            if not record_id:
-                note_attributes = order_data.get("note_attributes", [])
-                for attr in note_attributes:
-                    if attr.get("name", "").lower() == "record_id":
-                        record_id = attr.get("value")
-                        logger.info(f"Found record_id in note attributes: {record_id}")
-                        break
-
-            # 3. Check order note
-            if not record_id:
-                note = order_data.get("note", "")
-                if "Record ID:" in note:
-                    record_id = note.split("Record ID:")[1].strip().split()[0]
-                    logger.info(f"Found record_id in order note: {record_id}")
-
-            # 4. Check order tags
-            if not record_id:
-                tags = order_data.get("tags", "")
-                if "record_" in tags:
-                    for tag in tags.split(","):
-                        if tag.strip().startswith("record_"):
-                            record_id = tag.strip().replace("record_", "")
-                            logger.info(f"Found record_id in tags: {record_id}")
-                            break
-
-            # 5. Check cart attributes (from checkout)
-            if not record_id:
-                cart_attributes = order_data.get("cart_attributes", {})
-                record_id = cart_attributes.get("record_id")
+            for extractor in _EXTRACTORS:
+                record_id = extractor(order_data)
                 if record_id:
-                    logger.info(f"Found record_id in cart attributes: {record_id}")
-
-            # 6. Check customer attributes (alternative checkout location)
-            if not record_id:
-                customer = order_data.get("customer", {})
-                if customer:
-                    customer_note = customer.get("note", "")
-                    if "record_" in customer_note:
-                        import re
-                        match = re.search(r'record_(\d+)', customer_note)
-                        if match:
-                            record_id = match.group(1)
-                            logger.info(f"Found record_id in customer note: {record_id}")
-
-            # 7. Check order attributes (another possible location)
-            if not record_id:
-                order_attributes = order_data.get("order_attributes", [])
-                for attr in order_attributes:
-                    if attr.get("name", "").lower() == "record_id":
-                        record_id = attr.get("value")
-                        logger.info(f"Found record_id in order attributes: {record_id}")
-                        break
-
-            if record_id:
-                return int(record_id)
-            else:
-                logger.warning(f"Could not find record_id in order {order_data.get('id', 'unknown')}")
-                logger.debug(f"Order data: {json.dumps(order_data, indent=2)}")
-                return None
+                    return int(record_id)
+
+            logger.warning(f"Could not find record_id in order {order_data.get('id', 'unknown')}")
+            logger.debug(f"Order data: {json.dumps(order_data, indent=2)}")
+            return None
 
         except Exception as e:
             logger.error(f"Error extracting record ID: {e}")
             return None
 
+    @_safe()
     async def get_order_details(self, order_id: str) -> Optional[Dict]:
         """Get order details from Shopify"""
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.admin_api_url}/orders/{order_id}.json",
-                    headers=self.headers
-                )
-
-                if response.status_code == 200:
-                    return response.json()["order"]
-                else:
-                    logger.error(f"Failed to get order details: {response.text}")
-                    return None
+        client = await self._get_client()
+        response = await client.get(f"/orders/{order_id}.json")
 
-        except Exception as e:
-            logger.error(f"Error getting order details: {e}")
+        if response.status_code == 200:
+            return response.json()["order"]
+        else:
+            logger.error(f"Failed to get order details: {response.text}")
             return None
@@ -1,11 +1,19 @@
 import asyncio
+import hashlib
+import json
+import heapq
 import logging
+import math
 import os
+import random
 import re
-from collections import Counter
-from typing import Dict, Any, List, Optional
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 import httpx
+import redis.asyncio as redis
 from dotenv import load_dotenv
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,25 +24,230 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+TRANSLATE_MAX_ATTEMPTS = 3  # 单个批次调用翻译接口的最大尝试次数
+# 同时在途的翻译请求上限，同时也是共享客户端的连接池大小
+TRANSLATE_MAX_CONCURRENT = int(os.getenv("TRANSLATE_MAX_CONCURRENT", 32))
+# 批次打包上限：每批总字符数 / 条数
+TRANSLATE_BATCH_MAX_CHARS = int(os.getenv("TRANSLATE_BATCH_MAX_CHARS", 600))
+TRANSLATE_BATCH_MAX_ITEMS = int(os.getenv("TRANSLATE_BATCH_MAX_ITEMS", 20))
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", 7 * 24 * 3600))  # 7 days default
+# 剩余有效期不足该值的缓存仍然返回，但会在后台重新翻译刷新（stale-while-revalidate）
+TRANSLATION_CACHE_REFRESH_WINDOW = int(os.getenv("TRANSLATION_CACHE_REFRESH_WINDOW", 24 * 3600))  # 1 day default
+# 进程内 LRU 缓存的最大条数，位于 Redis 之前
+TRANSLATION_MEMORY_CACHE_SIZE = int(os.getenv("TRANSLATION_MEMORY_CACHE_SIZE", 10000))
+# 修改提示词或解析逻辑时递增，使旧的缓存翻译失效
+TRANSLATION_PROMPT_VERSION = 1
+
+# 模型返回的编号行："1. translation"，首尾空白不计入
+_NUM_LINE_RE = re.compile(r'^\s*(\d+)\.\s+(.+?)\s*$')
+
+# CJK 统一表意文字基本区
+_CJK_RE = re.compile('[\u4e00-\u9fff]')
+
+_BASE_PROMPT = """You are a professional Chinese-English translator for traditional astrology.
+
+RULES:
+1. Translate ALL numbered items EXACTLY - no explanations, no additions
+2. Return in same format: "1. [translation]", "2. [translation]", etc.
+3. Translate completely - no Chinese characters left
+4. Keep mystical fortune-telling tone
+5. Use proper astrology terms
+6. IMPORTANT: Use the provided custom terms EXACTLY as given when you encounter them"""
+
+# 基础术语，始终包含在提示词中
+_BASE_TERMS = {
+    "乾造": "Male Fortune",
+    "坤造": "Female Fortune",
+    "正印": "Direct Seal",
+    "偏印": "Indirect Seal",
+    "正官": "Direct Officer",
+    "五行": "Five Elements",
+    "八字": "Eight Characters"
+}
+
+
+def _format_system_prompt(terms_section: str) -> str:
+    return f"""{_BASE_PROMPT}
+
+Terms to use:
+{terms_section}
+
+Only return numbered translations."""
+
+
+# 没有数据库术语时的系统提示词，只在导入时构建一次
+_DEFAULT_SYSTEM_PROMPT = _format_system_prompt("\n".join(f"- {ch} = {en}" for ch, en in _BASE_TERMS.items()))
+
+
+async def _post_with_retry(client: httpx.AsyncClient, url: str, payload: Dict[str, Any]) -> httpx.Response:
+    """
+    POST 到翻译接口，遇到网络错误、429 或 5xx 时指数退避重试，最后一次失败时抛出异常。
+    其他 4xx（鉴权失败、请求格式错误等）重试也不会成功，直接抛出。
+    """
+    for attempt in range(TRANSLATE_MAX_ATTEMPTS):
+        try:
+            response = await client.post(url, json=payload)
+            response.raise_for_status()
+            return response
+        except (httpx.HTTPStatusError, httpx.TransportError) as e:
+            retryable = (not isinstance(e, httpx.HTTPStatusError)
+                         or e.response.status_code == 429 or e.response.status_code >= 500)
+            if not retryable or attempt == TRANSLATE_MAX_ATTEMPTS - 1:
+                raise
+            delay = 0.5 * 2 ** attempt + random.random() * 0.2
+            logger.warning(f"Translation API error (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+            await asyncio.sleep(delay)
+
+
+def _pack_batches(texts: List[str], max_chars: int, max_items: int) -> List[List[str]]:
+    """
+    贪心地把文本打包成批次，每批总字符数不超过 max_chars、条数不超过 max_items。
+    单条超过 max_chars 的文本单独成批。
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for text in texts:
+        if current and (current_chars + len(text) > max_chars or len(current) >= max_items):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(text)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def has_chinese(text: str) -> bool:
+    """Check if text contains Chinese characters"""
+    # 纯 ASCII 字符串（数字、日期、英文等）直接跳过；isascii 读取的是字符串对象上缓存的标志，不扫描内容
+    return not text.isascii() and _CJK_RE.search(text) is not None
+
+
+def find_chinese_texts(obj: Any) -> List[str]:
+    """Find all Chinese text in JSON structure"""
+    # dict 作为有序集合，遍历时即去重
+    texts: Dict[str, None] = {}
+    # 显式栈代替递归，(节点, 是否为字典键)；逆序入栈以保持原有的文档顺序
+    stack = [(obj, False)]
+
+    while stack:
+        data, is_key = stack.pop()
+        if isinstance(data, dict):
+            for key, value in reversed(data.items()):
+                stack.append((value, False))
+                stack.append((key, True))
+        elif isinstance(data, list):
+            stack.extend((item, False) for item in reversed(data))
+        elif isinstance(data, str):
+            stripped = data.strip()
+            if not stripped or not has_chinese(stripped):
+                continue
+            if is_key:
+                texts[stripped] = None
+                continue
+            lines = stripped.split('\n')
+            for line in lines:
+                line = line.strip()
+                if line and has_chinese(line):
+                    texts[line] = None
+            # 多行文本整体也作为一条待翻译文本；单行时整体就是上面那一行，无需重复添加
+            if len(lines) > 1:
+                texts[stripped] = None
+
+    return list(texts)
+
+
+def _translate_text(text: str, translations: Dict[str, str]) -> str:
+    """翻译单个含中文的字符串：整体命中则直接替换，否则逐行替换"""
+    translated = translations.get(text.strip())
+    if translated is not None:
+        return translated
+
+    # 单行文本已由上面的整体匹配处理
+    if '\n' not in text:
+        return text
+
+    changed = False
+    translated_lines = []
+    for line in text.split('\n'):
+        stripped_line = line.strip()
+        translated = translations.get(stripped_line)
+        if translated is not None and translated != stripped_line:
+            translated_lines.append(translated)
+            changed = True
+        else:
+            translated_lines.append(line)
+
+    return '\n'.join(translated_lines) if changed else text
+
+
+def apply_translations(obj: Any, translations: Dict[str, str]) -> Any:
+    """Apply translations to JSON structure"""
+    # 显式栈代替递归：(源节点, 目标容器, 目标位置)，先建好容器再把子节点写进去
+    root = [None]
+    stack = [(obj, root, 0)]
+
+    while stack:
+        data, parent, slot = stack.pop()
+        if isinstance(data, dict):
+            result = {}
+            parent[slot] = result
+            children = []
+            for k, v in data.items():
+                new_key = translations.get(k.strip(), k) if isinstance(k, str) and has_chinese(k) else k
+                result[new_key] = None  # 先占位，保持键的原有顺序
+                children.append((v, result, new_key))
+            # 逆序入栈使子节点按原顺序写入，译后键名冲突时与原先一样后者覆盖前者
+            stack.extend(reversed(children))
+        elif isinstance(data, list):
+            result = [None] * len(data)
+            parent[slot] = result
+            stack.extend((item, result, i) for i, item in enumerate(data))
+        elif isinstance(data, str) and has_chinese(data):
+            parent[slot] = _translate_text(data, translations)
+        else:
+            parent[slot] = data
+
+    return root[0]
+
 
 class TranslationTermsManager:
     """管理翻译术语对，包括从数据库加载和智能选择"""
 
     def __init__(self):
         self.all_terms: Dict[str, str] = {}
+        # 按术语首字建立的索引：首字 -> [(中文术语, 英文)]，用于单遍扫描匹配
+        self._terms_by_first_char: Dict[str, List[Tuple[str, str]]] = {}
         self.term_frequency: Counter = Counter()
         self.max_terms_in_prompt = 100  # 提示词中最多包含的术语数
         self.cache_ttl = 3600  # 1 hour
         self.last_cache_time = 0
+        self._load_lock = asyncio.Lock()
+        self.terms_version = "none"  # 术语表内容的摘要，作为翻译缓存 key 的一部分
+
+    def _is_cache_fresh(self) -> bool:
+        return bool(self.all_terms) and time.monotonic() - self.last_cache_time < self.cache_ttl
 
     async def load_from_database(self, db: AsyncSession) -> Dict[str, str]:
-        """从数据库加载所有翻译对"""
+        """从数据库加载所有翻译对，cache_ttl 内直接返回已加载的术语"""
+        if self._is_cache_fresh():
+            return self.all_terms
+
+        # 并发请求只让一个去查库，其余等待后直接使用结果
+        async with self._load_lock:
+            if self._is_cache_fresh():
+                return self.all_terms
+            return await self._load_from_database(db)
+
+    async def _load_from_database(self, db: AsyncSession) -> Dict[str, str]:
         try:
-            result = await db.execute(select(TranslationPair))
-            pairs = result.scalars().all()
+            # 流式分批读取，不一次性把所有翻译对载入内存
+            pairs = await db.stream_scalars(select(TranslationPair).execution_options(yield_per=1000))
 
-            self.all_terms = {}
-            for pair in pairs:
+            all_terms = {}
+            async for pair in pairs:
                 """
                 这里考虑的可能的数据形式是：
                 中文：
@@ -46,20 +259,26 @@ class TranslationTermsManager:
                     banana
                     potato
                 """
-                chinese_lines = pair.chinese_text.strip().split('\n')
-                english_lines = pair.english_text.strip().split('\n')
+                chinese_text = pair.chinese_text.strip()
+                english_text = pair.english_text.strip()
+                chinese_lines = chinese_text.splitlines()
+                english_lines = english_text.splitlines()
 
                 # 如果行数匹配，逐行对应才进行翻译
                 if len(chinese_lines) == len(english_lines):
-                    for ch, en in zip(chinese_lines, english_lines):
-                        ch = ch.strip()
-                        en = en.strip()
-                        if ch and en:
-                            self.all_terms[ch] = en
-                else:
+                    stripped_pairs = ((ch.strip(), en.strip()) for ch, en in zip(chinese_lines, english_lines))
+                    all_terms.update((ch, en) for ch, en in stripped_pairs if ch and en)
+                elif chinese_text and english_text:
                     # 否则作为整体处理
-                    self.all_terms[pair.chinese_text.strip()] = pair.english_text.strip()
-
+                    all_terms[chinese_text] = english_text
+
+            # 全部解析成功后再替换，加载失败时保留旧术语
+            self.all_terms = all_terms
+            self.last_cache_time = time.monotonic()
+            self._build_term_index()
+            self.terms_version = hashlib.sha1(
+                json.dumps(self.all_terms, sort_keys=True, ensure_ascii=False).encode('utf-8')
+            ).hexdigest()[:16]
             logger.info(f"Loaded {len(self.all_terms)} translation pairs from database")
             return self.all_terms
 
@@ -67,20 +286,34 @@ class TranslationTermsManager:
             logger.error(f"Error loading translation pairs: {e}")
             return {}
 
-    def find_relevant_terms(self, texts: List[str]) -> Dict[str, str]:
-        """找出与待翻译文本相关的术语，就是简单的判断字符串匹配次数"""
-        relevant_terms = {}
-
-        # 统计文本中的词频
-        all_text = ' '.join(texts)
-
+    def _build_term_index(self):
+        index: Dict[str, List[Tuple[str, str]]] = {}
         for chinese_term, english_term in self.all_terms.items():
-            # 检查术语是否出现在文本中
-            if chinese_term in all_text:
-                relevant_terms[chinese_term] = english_term
-                # 统计出现频率
-                count = sum(1 for text in texts if chinese_term in text)
-                self.term_frequency[chinese_term] = count
+            index.setdefault(chinese_term[0], []).append((chinese_term, english_term))
+        self._terms_by_first_char = index
+
+    def find_relevant_terms(self, texts: List[str]) -> Dict[str, str]:
+        """
+        找出与待翻译文本相关的术语，并统计每个术语出现在多少条文本中。
+        每条文本只扫描一遍，每个位置只比较以该字开头的术语，而不是对所有术语逐个做子串查找。
+        返回结果保持术语表（all_terms）的顺序，后续选词和提示词截取都依赖这个顺序。
+        """
+        text_counts = Counter()
+        index = self._terms_by_first_char
+
+        for text in texts:
+            found = set()
+            for i, ch in enumerate(text):
+                for chinese_term, _ in index.get(ch, ()):
+                    if chinese_term not in found and text.startswith(chinese_term, i):
+                        found.add(chinese_term)
+            text_counts.update(found)
+
+        relevant_terms = {zh: en for zh, en in self.all_terms.items() if zh in text_counts}
+
+        # 统计出现频率
+        for chinese_term, count in text_counts.items():
+            self.term_frequency[chinese_term] = count
 
         return relevant_terms
 
@@ -98,7 +331,8 @@ class TranslationTermsManager:
         # 2. 优先选择较短的术语（通常是更基础的词汇）
         # 3. 确保包含一些长短语（可能是专业术语）
 
-        scored_terms = []
+        short_scored = []
+        long_scored = []
         for term, translation in relevant_terms.items():
             frequency = self.term_frequency.get(term, 0)
             length_score = 1 / (1 + len(term) / 10)  # 长度分数，越短分数越高
@@ -109,226 +343,120 @@ class TranslationTermsManager:
             if is_phrase and frequency > 0:
                 score += 0.5  # 给出现的短语加分
 
-            scored_terms.append((score, term, translation))
+            (long_scored if is_phrase else short_scored).append((score, term, translation))
 
-        # 按分数排序，选择前N个
-        scored_terms.sort(reverse=True)
-        selected = {}
+        # 保持短术语和长术语的平衡（约 7:3），各自只取分数最高的若干个，无需对全部术语排序
+        short_quota = math.ceil(self.max_terms_in_prompt * 0.7)
+        long_quota = math.ceil(self.max_terms_in_prompt * 0.3)
+        top_terms = heapq.nlargest(short_quota, short_scored) + heapq.nlargest(long_quota, long_scored)
+        top_terms.sort(reverse=True)
 
-        # 确保有一定的多样性
-        short_count = 0
-        long_count = 0
-
-        for score, term, translation in scored_terms:
-            if len(selected) >= self.max_terms_in_prompt:
-                break
-
-            # 保持短术语和长术语的平衡
-            if len(term) <= 4:
-                if short_count < self.max_terms_in_prompt * 0.7:
-                    selected[term] = translation
-                    short_count += 1
-            else:
-                if long_count < self.max_terms_in_prompt * 0.3:
-                    selected[term] = translation
-                    long_count += 1
+        selected = {term: translation for _, term, translation in top_terms[:self.max_terms_in_prompt]}
 
         logger.info(f"Selected {len(selected)} terms from {len(relevant_terms)} relevant terms")
         return selected
 
 
-class TranslationService:
-    """Simple translation service for Chinese astrology content with concurrent processing"""
-
-    def __init__(self):
-        self.api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.api_url = os.getenv("DEEPSEEK_API_URL", "https://api.lkeap.cloud.tencent.com/v1/chat/completions")
-        self.model = os.getenv("DEEPSEEK_MODEL", "deepseek-v3-0324")
-        self.max_concurrent = 32
-        self.batch_size = 2
-
-    @staticmethod
-    def has_chinese(text: str) -> bool:
-        """Check if text contains Chinese characters"""
-        return any('\u4e00' <= c <= '\u9fff' for c in text)
-
-    def find_chinese_texts(self, obj: Any) -> List[str]:
-        """Find all Chinese text in JSON structure"""
-        texts = []
-
-        def extract(data):
-            if isinstance(data, dict):
-                for key, value in data.items():
-                    if isinstance(key, str) and self.has_chinese(key) and key.strip():
-                        texts.append(key.strip())
-                    extract(value)
-            elif isinstance(data, list):
-                for item in data:
-                    extract(item)
-            elif isinstance(data, str) and self.has_chinese(data) and data.strip():
-                lines = data.strip().split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if self.has_chinese(line) and line:
-                        texts.append(line)
-                if self.has_chinese(data.strip()):
-                    texts.append(data.strip())
-
-        extract(obj)
-        return list(dict.fromkeys(text for text in texts if text.strip()))
-
-    async def translate_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> Dict[str, str]:
-        """Translate a small batch of texts in one API call"""
-        if not texts:
-            return {}
-
-        async with semaphore:  # 控制并发数
-            # Create numbered list
-            numbered = [f"{i + 1}. {text}" for i, text in enumerate(texts)]
-            batch_text = "\n\n".join(numbered)
-
-            system_prompt = """You are a professional Chinese-English translator for traditional astrology.
-
-RULES:
-1. Translate ALL numbered items EXACTLY - no explanations, no additions
-2. Return in same format: "1. [translation]", "2. [translation]", etc.
-3. Translate completely - no Chinese characters left
-4. Keep mystical fortune-telling tone
-5. Use proper astrology terms
-
-Terms:
-- 乾造 = Male Fortune
-- 坤造 = Female Fortune  
-- 正印 = Direct Seal
-- 偏印 = Indirect Seal
-- 正官 = Direct Officer
-- 五行 = Five Elements
-- 八字 = Eight Characters
-
-Only return numbered translations."""
-
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Translate:\n\n{batch_text}"}
-                ],
-                "temperature": 0.3,
-                "top_p": 0.8,
-                "max_tokens": 2048
-            }
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            try:
-                async with httpx.AsyncClient(timeout=90.0) as client:
-                    response = await client.post(self.api_url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    result = response.json()["choices"][0]["message"]["content"]
-
-                    # Parse results
-                    translations = {}
-                    for line in result.split('\n'):
-                        match = re.match(r'^(\d+)\.\s+(.+)', line.strip())
-                        if match:
-                            index = int(match.group(1)) - 1
-                            translation = match.group(2).strip()
-                            if index < len(texts):
-                                translations[texts[index]] = translation
-
-                    # 补充缺失的翻译（使用原文）
-                    for text in texts:
-                        if text not in translations:
-                            logger.warning(f"Translation missing for: {text[:50]}...")
-                            translations[text] = text
-
-                    return translations
-
-            except Exception as e:
-                logger.error(f"Translation API error for batch: {e}")
-                return {text: text for text in texts}  # Return originals on error
-
-    async def batch_translate(self, texts: List[str]) -> Dict[str, str]:
-        """Translate multiple texts using concurrent API calls"""
+class TranslationCache:
+    """
+    翻译结果缓存：进程内 LRU + Redis 两级。key 由文本、模型、提示词版本和术语表摘要共同决定，
+    管理员修改术语后旧缓存自然失效。未配置 REDIS_URL 或 Redis 出错时只使用进程内缓存，不影响翻译。
+    剩余有效期不足 refresh_window 的条目照常返回，同时报告为需要刷新，由调用方在后台重新翻译，
+    避免条目过期的那一刻请求同步等待翻译接口。
+    """
+
+    _PREFIX = "translation:"
+
+    def __init__(self, redis_url: Optional[str] = None, ttl: int = TRANSLATION_CACHE_TTL,
+                 memory_size: int = TRANSLATION_MEMORY_CACHE_SIZE,
+                 refresh_window: int = TRANSLATION_CACHE_REFRESH_WINDOW):
+        redis_url = redis_url or os.getenv("REDIS_URL")
+        self.redis = redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.refresh_window = min(refresh_window, ttl)
+        # key -> (译文, 过期时刻)，时刻取 time.monotonic()
+        self._memory: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+
+    def _remember(self, key: str, translation: str, remaining_ttl: float) -> None:
+        self._memory[key] = (translation, time.monotonic() + remaining_ttl)
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    @classmethod
+    def make_key(cls, text: str, model: str, terms_version: str) -> str:
+        raw = f"{model}\0{TRANSLATION_PROMPT_VERSION}\0{terms_version}\0{text}"
+        return f"{cls._PREFIX}{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    async def get_many(self, texts: List[str], model: str,
+                       terms_version: str) -> Tuple[Dict[str, str], List[str]]:
+        """
+        批量读取缓存：先查进程内缓存，未命中的再用一次 pipeline（GET + TTL）查 Redis。
+
+        Returns:
+            (命中的 {原文: 译文}, 命中但即将过期、需要后台刷新的原文列表)
+        """
+        hits = {}
+        stale = []
         if not texts:
-            return {}
-
-        logger.info(f"Starting concurrent translation for {len(texts)} texts...")
-
-        semaphore = asyncio.Semaphore(self.max_concurrent)
-        batches = []
-        texts_list = list(texts)  # 确保是列表
-        for i in range(0, len(texts_list), self.batch_size):
-            batch = texts_list[i:i + self.batch_size]
-            batches.append(batch)
-
-        logger.info(f"Split into {len(batches)} batches of up to {self.batch_size} texts each")
-
-        tasks = [self.translate_batch(batch, semaphore) for batch in batches]
-        batch_results = await asyncio.gather(*tasks)
-
-        all_translations = {}
-        for batch_result in batch_results:
-            all_translations.update(batch_result)
-
-        logger.info(f"Completed translation of {len(all_translations)} texts")
-        return all_translations
-
-    def apply_translations(self, obj: Any, translations: Dict[str, str]) -> Any:
-        """Apply translations to JSON structure"""
-        if isinstance(obj, dict):
-            result = {}
-            for k, v in obj.items():
-                new_key = translations.get(k.strip(), k) if isinstance(k, str) and self.has_chinese(k) else k
-                result[new_key] = self.apply_translations(v, translations)
-            return result
-        elif isinstance(obj, list):
-            return [self.apply_translations(item, translations) for item in obj]
-        elif isinstance(obj, str) and self.has_chinese(obj):
-            if obj.strip() in translations:
-                return translations[obj.strip()]
-
-            lines = obj.split('\n')
-            translated_lines = [translations.get(line.strip(), line) for line in lines]
-
-            if translated_lines != [line.strip() for line in lines]:
-                return '\n'.join(translated_lines)
-            return obj
-        return obj
-
-    async def translate_json(self, data: dict) -> dict:
-        """Translate entire JSON structure while preserving format"""
-        logger.info("Starting translation process...")
-
-        # Find all Chinese texts
-        chinese_texts = self.find_chinese_texts(data)
-        if not chinese_texts:
-            logger.info("No Chinese text found. Skipping translation.")
-            return data
-
-        logger.info(f"Found {len(chinese_texts)} unique Chinese texts to translate.")
-
-        # Translate with concurrency
-        translations = await self.batch_translate(chinese_texts)
-        if len(translations) < len(chinese_texts):
-            logger.warning(f"Translation may be incomplete. Expected {len(chinese_texts)} but got {len(translations)}.")
-        else:
-            logger.info(f"Successfully translated {len(translations)} texts.")
-
-        # Apply translations
-        translated_data = self.apply_translations(data, translations)
-        logger.info("Translation process complete.")
+            return hits, stale
+        now = time.monotonic()
+        misses = []
+        for text in texts:
+            key = self.make_key(text, model, terms_version)
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                hits[text] = entry[0]
+                if entry[1] - now <= self.refresh_window:
+                    stale.append(text)
+            else:
+                misses.append((text, key))
 
-        return translated_data
+        if self.redis is None or not misses:
+            return hits, stale
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for _, key in misses:
+                pipe.get(key)
+                pipe.ttl(key)
+            results = await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Translation cache read failed: {e}")
+            return hits, stale
+        for (text, key), value, ttl in zip(misses, results[::2], results[1::2]):
+            if value is None:
+                continue
+            remaining = ttl if ttl >= 0 else self.ttl  # -1: 没有设置过期时间
+            self._remember(key, value, remaining)
+            hits[text] = value
+            if remaining <= self.refresh_window:
+                stale.append(text)
+        return hits, stale
+
+    async def set_many(self, translations: Dict[str, str], model: str, terms_version: str) -> None:
+        """批量写入缓存"""
+        if not translations:
+            return
+        keyed = [(self.make_key(text, model, terms_version), translation)
+                 for text, translation in translations.items()]
+        for key, translation in keyed:
+            self._remember(key, translation, self.ttl)
+
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key, translation in keyed:
+                pipe.set(key, translation, ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Translation cache write failed: {e}")
 
-    async def extract_and_translate_astrology_result(self, astrology_data: dict) -> dict | None:
-        """Main translation entry point"""
-        if not astrology_data:
-            return None
-        return await self.translate_json(astrology_data)
+    async def aclose(self):
+        if self.redis is not None:
+            await self.redis.close()
 
 
 class EnhancedTranslationService:
@@ -338,165 +466,129 @@ class EnhancedTranslationService:
         self.api_key = os.getenv("DEEPSEEK_API_KEY")
         self.api_url = os.getenv("DEEPSEEK_API_URL", "https://api.lkeap.cloud.tencent.com/v1/chat/completions")
         self.model = os.getenv("DEEPSEEK_MODEL", "deepseek-v3-0324")
-        self.max_concurrent = 32
-        self.batch_size = 2
+        # 每次请求都相同的部分只构建一次（请求头挂在共享客户端上）
+        self._payload_base = {
+            "model": self.model,
+            "temperature": 0.3,
+            "top_p": 0.8,
+            "max_tokens": 2048
+        }
+        self.max_concurrent = TRANSLATE_MAX_CONCURRENT
+        # 信号量与连接池上限一致，在实例上共享，多个并发的 batch_translate 调用共用同一预算
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        # 按字符预算打包批次：系统提示词每次请求都要发送，批次越大摊销越多
+        self.batch_max_chars = TRANSLATE_BATCH_MAX_CHARS
+        self.batch_max_items = TRANSLATE_BATCH_MAX_ITEMS
+        # 所有批次共用一个 HTTP 客户端，避免每批都重新建立 TCP+TLS 连接
+        self._client: Optional[httpx.AsyncClient] = None
+        # 缓存后台刷新（stale-while-revalidate）：进行中的任务和正在刷新的文本
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self._refreshing: Set[str] = set()
         self.terms_manager = TranslationTermsManager()
+        self.cache = TranslationCache()
         self.db_session: Optional[AsyncSession] = None
 
     def set_db_session(self, session: AsyncSession):
         """设置数据库会话"""
         self.db_session = session
 
-    @staticmethod
-    def has_chinese(text: str) -> bool:
-        """Check if text contains Chinese characters"""
-        return any('\u4e00' <= c <= '\u9fff' for c in text)
-
-    def find_chinese_texts(self, obj: Any) -> List[str]:
-        """Find all Chinese text in JSON structure"""
-        texts = []
-
-        def extract(data):
-            if isinstance(data, dict):
-                for key, value in data.items():
-                    if isinstance(key, str) and self.has_chinese(key) and key.strip():
-                        texts.append(key.strip())
-                    extract(value)
-            elif isinstance(data, list):
-                for item in data:
-                    extract(item)
-            elif isinstance(data, str) and self.has_chinese(data) and data.strip():
-                lines = data.strip().split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if self.has_chinese(line) and line:
-                        texts.append(line)
-                if self.has_chinese(data.strip()):
-                    texts.append(data.strip())
-
-        extract(obj)
-        return list(dict.fromkeys(text for text in texts if text.strip()))
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(90.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent,
+                    max_keepalive_connections=self.max_concurrent
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self._client
+
+    async def aclose(self):
+        """取消未完成的缓存刷新并关闭共享的 HTTP 客户端，应在应用关闭时调用"""
+        for task in self._refresh_tasks:
+            task.cancel()
+        await asyncio.gather(*self._refresh_tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.cache.aclose()
 
     @staticmethod
     def build_system_prompt(custom_terms: Dict[str, str]) -> str:
         """构建包含自定义术语的系统提示词"""
-        base_prompt = """You are a professional Chinese-English translator for traditional astrology.
-
-RULES:
-1. Translate ALL numbered items EXACTLY - no explanations, no additions
-2. Return in same format: "1. [translation]", "2. [translation]", etc.
-3. Translate completely - no Chinese characters left
-4. Keep mystical fortune-telling tone
-5. Use proper astrology terms
-6. IMPORTANT: Use the provided custom terms EXACTLY as given when you encounter them"""
-
-        # 添加基础术语
-        base_terms = {
-            "乾造": "Male Fortune",
-            "坤造": "Female Fortune",
-            "正印": "Direct Seal",
-            "偏印": "Indirect Seal",
-            "正官": "Direct Officer",
-            "五行": "Five Elements",
-            "八字": "Eight Characters"
-        }
+        if not custom_terms:
+            return _DEFAULT_SYSTEM_PROMPT
 
         # 合并自定义术语
-        all_terms = {**base_terms, **custom_terms}
-
-        if not custom_terms:
-            # 如果没有自定义术语，使用原始提示词
-            terms_section = "\n".join([f"- {ch} = {en}" for ch, en in base_terms.items()])
-        else:
-            # 格式化术语列表
-            terms_list = []
+        all_terms = {**_BASE_TERMS, **custom_terms}
 
+        if len(all_terms) <= 50:
             # 如果术语不多，详细列出
-            if len(all_terms) <= 50:
-                for chinese, english in all_terms.items():
-                    terms_list.append(f"- {chinese} = {english}")
-                terms_section = "\n".join(terms_list)
-            else:
-                # 如果术语很多，分组显示
-                # 短术语（基础词汇）
-                short_terms = {k: v for k, v in all_terms.items() if len(k) <= 4}
-                long_terms = {k: v for k, v in all_terms.items() if len(k) > 4}
-
-                terms_section = "Common Terms:\n"
-                terms_section += "\n".join([f"- {ch} = {en}" for ch, en in list(short_terms.items())[:30]])
-
-                if long_terms:
-                    terms_section += "\n\nSpecialized Phrases:\n"
-                    terms_section += "\n".join([f"- {ch} = {en}" for ch, en in list(long_terms.items())[:20]])
-
-        full_prompt = f"""{base_prompt}
+            terms_section = "\n".join(f"- {ch} = {en}" for ch, en in all_terms.items())
+        else:
+            # 如果术语很多，分组显示：短术语（基础词汇）最多30个，长短语最多20个
+            short_terms = ((ch, en) for ch, en in all_terms.items() if len(ch) <= 4)
+            long_terms = ((ch, en) for ch, en in all_terms.items() if len(ch) > 4)
 
-Terms to use:
-{terms_section}
+            terms_section = "Common Terms:\n"
+            terms_section += "\n".join(f"- {ch} = {en}" for ch, en in islice(short_terms, 30))
 
-Only return numbered translations."""
+            long_section = "\n".join(f"- {ch} = {en}" for ch, en in islice(long_terms, 20))
+            if long_section:
+                terms_section += "\n\nSpecialized Phrases:\n" + long_section
 
-        return full_prompt
+        return _format_system_prompt(terms_section)
 
     async def translate_batch(
             self,
             texts: List[str],
-            semaphore: asyncio.Semaphore,
+            system_prompt: str,
             custom_terms: Dict[str, str]
     ) -> Dict[str, str]:
         """Translate a small batch of texts in one API call with custom terms"""
         if not texts:
             return {}
 
-        async with semaphore:
+        async with self._semaphore:
             numbered = [f"{i + 1}. {text}" for i, text in enumerate(texts)]
             batch_text = "\n\n".join(numbered)
 
-            # 使用包含自定义术语的提示词
-            system_prompt = self.build_system_prompt(custom_terms)
-
             payload = {
-                "model": self.model,
+                **self._payload_base,
                 "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": f"Translate:\n\n{batch_text}"}
-                ],
-                "temperature": 0.3,
-                "top_p": 0.8,
-                "max_tokens": 2048
-            }
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
+                ]
             }
 
             try:
-                async with httpx.AsyncClient(timeout=90.0) as client:
-                    response = await client.post(self.api_url, headers=headers, json=payload)
-                    response.raise_for_status()
-                    result = response.json()["choices"][0]["message"]["content"]
-
-                    translations = {}
-                    for line in result.split('\n'):
-                        match = re.match(r'^(\d+)\.\s+(.+)', line.strip())
-                        if match:
-                            index = int(match.group(1)) - 1
-                            translation = match.group(2).strip()
-                            if index < len(texts):
-                                translations[texts[index]] = translation
-
-                    # 补充缺失的翻译
-                    for text in texts:
-                        if text not in translations:
-                            # 尝试使用自定义术语直接翻译
-                            if text in custom_terms:
-                                translations[text] = custom_terms[text]
-                            else:
-                                logger.warning(f"Translation missing for: {text[:50]}...")
-                                translations[text] = text
-
-                    return translations
+                response = await _post_with_retry(self._get_client(), self.api_url, payload)
+                result = response.json()["choices"][0]["message"]["content"]
+
+                translations = {}
+                for line in result.splitlines():
+                    match = _NUM_LINE_RE.match(line)
+                    if match:
+                        index = int(match.group(1)) - 1
+                        translation = match.group(2)
+                        if index < len(texts):
+                            translations[texts[index]] = translation
+
+                # 补充缺失的翻译
+                for text in texts:
+                    if text not in translations:
+                        # 尝试使用自定义术语直接翻译
+                        if text in custom_terms:
+                            translations[text] = custom_terms[text]
+                        else:
+                            logger.warning(f"Translation missing for: {text[:50]}...")
+                            translations[text] = text
+
+                return translations
 
             except Exception as e:
                 logger.error(f"Translation API error for batch: {e}")
@@ -511,60 +603,89 @@ Only return numbered translations."""
         logger.info(f"Starting concurrent translation for {len(texts)} texts...")
 
         # 加载数据库术语（如果有数据库会话）
-        custom_terms = {}
+        all_translations = {}
         if self.db_session:
             await self.terms_manager.load_from_database(self.db_session)
+
+            # 与术语完全相同的文本直接使用术语翻译，不再调用API
+            all_terms = self.terms_manager.all_terms
+            all_translations = {text: all_terms[text] for text in texts if text in all_terms}
+            if all_translations:
+                texts = [text for text in texts if text not in all_translations]
+                logger.info(f"Translated {len(all_translations)} texts directly from database terms")
+                if not texts:
+                    return all_translations
+
+        # 先查翻译缓存，只把未命中的文本发给API；即将过期的命中照常使用，并在后台刷新
+        terms_version = self.terms_manager.terms_version
+        cached, stale = await self.cache.get_many(texts, self.model, terms_version)
+        if stale:
+            self._schedule_refresh(stale, terms_version)
+        if cached:
+            all_translations.update(cached)
+            texts = [text for text in texts if text not in cached]
+            logger.info(f"Translation cache hit for {len(cached)} texts ({len(stale)} due for refresh)")
+            if not texts:
+                return all_translations
+
+        all_translations.update(await self._translate_uncached(texts, terms_version))
+
+        logger.info(f"Completed translation of {len(all_translations)} texts")
+        return all_translations
+
+    async def _translate_uncached(self, texts: List[str], terms_version: str) -> Dict[str, str]:
+        """调用翻译接口翻译 texts，并把成功的结果写入缓存"""
+        custom_terms = {}
+        if self.db_session:
             # 选择相关术语
             custom_terms = self.terms_manager.select_terms_for_prompt(texts)
             logger.info(f"Using {len(custom_terms)} custom terms from database")
 
-        semaphore = asyncio.Semaphore(self.max_concurrent)
-        batches = []
-        texts_list = list(texts)
-        for i in range(0, len(texts_list), self.batch_size):
-            batch = texts_list[i:i + self.batch_size]
-            batches.append(batch)
+        batches = _pack_batches(texts, self.batch_max_chars, self.batch_max_items)
 
-        logger.info(f"Split into {len(batches)} batches of up to {self.batch_size} texts each")
+        logger.info(f"Split into {len(batches)} batches of up to {self.batch_max_items} texts / {self.batch_max_chars} chars each")
 
-        tasks = [self.translate_batch(batch, semaphore, custom_terms) for batch in batches]
-        batch_results = await asyncio.gather(*tasks)
+        # 提示词对所有批次都相同，只构建一次
+        system_prompt = self.build_system_prompt(custom_terms)
+        tasks = [self.translate_batch(batch, system_prompt, custom_terms) for batch in batches]
 
-        all_translations = {}
-        for batch_result in batch_results:
-            all_translations.update(batch_result)
+        # 批次之间文本互不重叠，按完成顺序合并即可，无需等所有批次返回后再统一处理
+        api_translations = {}
+        for next_done in asyncio.as_completed(tasks):
+            api_translations.update(await next_done)
 
-        logger.info(f"Completed translation of {len(all_translations)} texts")
-        return all_translations
+        # 译文与原文相同说明翻译失败（回退为原文），不写入缓存
+        await self.cache.set_many(
+            {text: translation for text, translation in api_translations.items() if translation != text},
+            self.model, terms_version
+        )
+        return api_translations
 
-    def apply_translations(self, obj: Any, translations: Dict[str, str]) -> Any:
-        """Apply translations to JSON structure"""
-        if isinstance(obj, dict):
-            result = {}
-            for k, v in obj.items():
-                new_key = translations.get(k.strip(), k) if isinstance(k, str) and self.has_chinese(k) else k
-                result[new_key] = self.apply_translations(v, translations)
-            return result
-        elif isinstance(obj, list):
-            return [self.apply_translations(item, translations) for item in obj]
-        elif isinstance(obj, str) and self.has_chinese(obj):
-            if obj.strip() in translations:
-                return translations[obj.strip()]
-
-            lines = obj.split('\n')
-            translated_lines = [translations.get(line.strip(), line) for line in lines]
-
-            if translated_lines != [line.strip() for line in lines]:
-                return '\n'.join(translated_lines)
-            return obj
-        return obj
+    def _schedule_refresh(self, texts: List[str], terms_version: str) -> None:
+        """在后台重新翻译即将过期的缓存条目；同一文本同时只有一个刷新任务"""
+        texts = [text for text in texts if text not in self._refreshing]
+        if not texts:
+            return
+        self._refreshing.update(texts)
+        task = asyncio.create_task(self._refresh_cached(texts, terms_version))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh_cached(self, texts: List[str], terms_version: str) -> None:
+        try:
+            await self._translate_uncached(texts, terms_version)
+            logger.info(f"Refreshed {len(texts)} cached translations")
+        except Exception as e:
+            logger.warning(f"Background translation cache refresh failed: {e}")
+        finally:
+            self._refreshing.difference_update(texts)
 
     async def translate_json(self, data: dict) -> dict:
         """Translate entire JSON structure while preserving format"""
         logger.info("Starting translation process...")
 
         # Find all Chinese texts
-        chinese_texts = self.find_chinese_texts(data)
+        chinese_texts = find_chinese_texts(data)
         if not chinese_texts:
             logger.info("No Chinese text found. Skipping translation.")
             return data
@@ -579,7 +700,7 @@ Only return numbered translations."""
             logger.info(f"Successfully translated {len(translations)} texts.")
 
         # Apply translations
-        translated_data = self.apply_translations(data, translations)
+        translated_data = apply_translations(data, translations)
         logger.info("Translation process complete.")
 
         return translated_data
@@ -1,7 +1,7 @@
+import hmac
 import logging
 import os
-import random
-import string
+import secrets
 from typing import Optional
 
 import redis
@@ -62,7 +62,8 @@ class VerificationService:
     @staticmethod
     def generate_verification_code(length: int = 6) -> str:
         """Generate random verification code."""
-        return ''.join(random.choices(string.digits, k=length))
+        # secrets 使用系统 CSPRNG，一次取整后补零到固定长度
+        return f"{secrets.randbelow(10 ** length):0{length}d}"
 
     def store_verification_code(self, email: str, code: str) -> None:
         """
@@ -105,7 +106,8 @@ class VerificationService:
         if not stored_code:
             raise VerificationCodeExpiredError("Verification code has expired or does not exist")
 
-        if stored_code != code:
+        # constant-time compare so response timing doesn't leak matching digits
+        if not hmac.compare_digest(stored_code.encode('utf-8'), code.encode('utf-8')):
             raise VerificationCodeInvalidError("Invalid verification code")
 
         # Delete verification code and set verified status